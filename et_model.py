@@ -1,6 +1,10 @@
+import gc
+import math
 import pandas as pd
 import numpy as np
 import yaml
+from pathlib import Path
+from numba import njit, prange, vectorize, float32, float64
 from pvlib.iotools import read_epw
 from pandas import ExcelWriter
 
@@ -8,34 +12,57 @@ from pandas import ExcelWriter
 LAMBDA = 2.45  # MJ/kg, latent heat of vaporisation
 MJ_TO_KWH = 1 / 3.6
 GAMMA = 0.0665  # Psychrometric constant
+WEATHER_COLUMNS = ['T', 'u2', 'RH', 'GHI', 'Precip_mm']
+
+# Saturation vapour pressure lookup table (°C -> kPa), linearly interpolated
+_T_MIN, _T_MAX = -50.0, 60.0
+_T_GRID = np.linspace(_T_MIN, _T_MAX, 4096)
+_ES_GRID = 0.6108 * np.exp((17.27 * _T_GRID) / (_T_GRID + 237.3))
+_INV_DX = (len(_T_GRID) - 1) / (_T_MAX - _T_MIN)
 
 # File paths
 epw_file = 'weather.epw'
 props_csv = 'plant_properties.csv'
 config_file = 'config.yaml'
 output_excel = 'et_hourly_results.xlsx'
+weather_cache = Path(epw_file).with_suffix('.parquet')
 
 # Load weather data
+# The parsed EPW columns are cached as Parquet next to the EPW file and reused until it changes
 try:
-    epw_data, _ = read_epw(epw_file)
-    weather_df = epw_data[['temp_air', 'wind_speed', 'relative_humidity', 'ghi', 'Liquid Precipitation Depth']].copy()
-    weather_df.columns = ['T', 'u2', 'RH', 'GHI', 'Precip_mm']
+    weather_df = None
+    if weather_cache.exists() and weather_cache.stat().st_mtime >= Path(epw_file).stat().st_mtime:
+        cached_df = pd.read_parquet(weather_cache)
+        # Only reuse a cache written with the current column selection and dtypes
+        if list(cached_df.columns) == WEATHER_COLUMNS and (cached_df.dtypes == np.float64).all():
+            weather_df = cached_df
+    if weather_df is None:
+        epw_data, _ = read_epw(epw_file)
+        epw_cols = [epw_data.columns.get_loc(c) for c in ['temp_air', 'wind_speed', 'relative_humidity', 'ghi', 'liquid_precipitation_depth']]
+        weather_df = epw_data.iloc[:, epw_cols].astype(np.float64)
+        weather_df.columns = WEATHER_COLUMNS
+        # Release the remaining EPW fields before the simulation allocates its results
+        del epw_data
+        gc.collect()
+        try:
+            weather_df.to_parquet(weather_cache)
+        except Exception as e:
+            print(f"Warning: could not cache weather data to {weather_cache}: {e}")
 except Exception as e:
     print(f"Error loading weather data from {epw_file}: {e}")
     raise
 # Load plant data
 props_df = pd.read_csv(props_csv)
+props_map = props_df.drop_duplicates('Plant Type').set_index('Plant Type').to_dict(orient='index')
 with open(config_file, 'r') as f:
     config = yaml.safe_load(f)
 
 # Merge properties into config
 plants_config = []
 for plant in config['plants']:
-    row = props_df.loc[props_df['Plant Type'] == plant['type']]
-    if row.empty:
-        available_types = props_df['Plant Type'].unique()
-        raise ValueError(f"Plant type '{plant['type']}' not found in plant_properties.csv. Available types: {', '.join(available_types)}")
-    props = row.iloc[0]
+    if plant['type'] not in props_map:
+        raise ValueError(f"Plant type '{plant['type']}' not found in plant_properties.csv. Available types: {', '.join(props_map)}")
+    props = props_map[plant['type']]
     plants_config.append({
         'type': plant['type'],
         'area_m2': plant['area_m2'],
@@ -46,17 +73,28 @@ for plant in config['plants']:
     })
 
 # Helper functions
+@vectorize([float32(float32), float64(float64)], nopython=True, target='cpu', cache=True)
 def saturation_vapour_pressure(T):
     """
     Calculates the saturation vapor pressure for a given air temperature.
     
+    Compiled as a NumPy ufunc. Values are linearly interpolated from a precomputed table covering -50 to 60 °C; temperatures outside that range are clamped to its ends.
+    
     Args:
-        T: Air temperature in degrees Celsius.
+        T: Air temperature in degrees Celsius (scalar or array).
     
     Returns:
         The saturation vapor pressure in kilopascals (kPa).
     """
-    return 0.6108 * np.exp((17.27 * T) / (T + 237.3))
+    if math.isnan(T):
+        return T
+    x = (T - _T_MIN) * _INV_DX
+    if x <= 0.0:
+        return _ES_GRID[0]
+    if x >= len(_ES_GRID) - 1:
+        return _ES_GRID[-1]
+    i = int(x)
+    return _ES_GRID[i] + (x - i) * (_ES_GRID[i + 1] - _ES_GRID[i])
 
 def delta_vapour_pressure(T):
     """
@@ -71,60 +109,133 @@ def delta_vapour_pressure(T):
     es = saturation_vapour_pressure(T)
     return 4098 * es / (T + 237.3)**2
 
-def calculate_et0(row: pd.Series) -> float:
+def calculate_et0_vec(df: pd.DataFrame) -> np.ndarray:
     """
-    Calculates hourly reference evapotranspiration (ET0) in millimeters using the FAO Penman-Monteith equation.
+    Calculates hourly reference evapotranspiration (ET0) in millimeters for every row of a weather DataFrame using the FAO Penman-Monteith equation.
     
     Args:
-        row: A pandas Series containing weather data with keys 'T' (temperature in °C), 'u2' (wind speed in m/s), 'RH' (relative humidity in %), and 'GHI' (global horizontal irradiance in W/m²).
+        df: A pandas DataFrame containing weather data with columns 'T' (temperature in °C), 'u2' (wind speed in m/s), 'RH' (relative humidity in %), and 'GHI' (global horizontal irradiance in W/m²).
     
     Returns:
-        The computed hourly reference evapotranspiration (ET0) in millimeters. The value is non-negative.
+        A NumPy array of hourly reference evapotranspiration (ET0) in millimeters, one value per row. All values are non-negative.
     """
-    T, u2, RH, GHI = row['T'], row['u2'], row['RH'], row['GHI']
+    T = df['T'].to_numpy(dtype=np.float64)
+    u2 = df['u2'].to_numpy(dtype=np.float64)
+    RH = df['RH'].to_numpy(dtype=np.float64)
+    GHI = df['GHI'].to_numpy(dtype=np.float64)
+    # Derive the slope from es directly rather than via delta_vapour_pressure, which would look es up again
+    denom = T + 237.3
     es = saturation_vapour_pressure(T)
     ea = es * RH / 100
-    delta = delta_vapour_pressure(T)
+    delta = 4098 * es / (denom * denom)
     Rn = GHI * 0.8 / 3.6  # MJ/m²/hr
     et0 = ((0.408 * delta * Rn) + (GAMMA * (900 / (T + 273)) * u2 * (es - ea))) / (delta + GAMMA * (1 + 0.34 * u2))
-    return max(et0, 0)
+    return np.maximum(et0, 0.0)
+
+def calculate_et0(row: pd.Series) -> float:
+    """
+    Calculates hourly reference evapotranspiration (ET0) in millimeters for a single weather record.
+    
+    Args:
+        row: A pandas Series containing weather data with keys 'T', 'u2', 'RH' and 'GHI' (see calculate_et0_vec).
+    
+    Returns:
+        The computed hourly reference evapotranspiration (ET0) in millimeters. The value is non-negative.
+    """
+    return float(calculate_et0_vec(row.to_frame().T)[0])
+
+def rainfall_infiltration(P):
+    """
+    Calculates the part of hourly precipitation that infiltrates the soil, using a simple rainfall intensity threshold.
+    
+    Above 20mm in an hour, 70% of the excess rainfall is assumed to become runoff.
+    
+    Args:
+        P: NumPy array of hourly precipitation in metres.
+    
+    Returns:
+        A NumPy array of hourly infiltrating precipitation in metres, with the same dtype as P.
+    """
+    return np.where(P > 0.02, 0.02 + (P - 0.02) * 0.3, P)
 
-def xl_col_letter(col_name):
+# Explicit signatures compile the kernel eagerly at import; with cache=True later runs load it from __pycache__
+@njit('UniTuple(float64[:, :], 3)(float64[:], float64[:], float64[:], float64[:], float64[:], float64[:])',
+      parallel=True, cache=True, fastmath=True)
+def simulate_soil_moisture(P_inf, ET0, theta_fc, theta_wp, kc, root_depth):
     """
-    Returns the Excel column letter corresponding to a DataFrame column name.
+    Runs the hourly soil moisture balance for every plant, in parallel across plants.
     
     Args:
-        col_name: The name of the column to convert.
+        P_inf: NumPy array of hourly infiltrating precipitation in metres.
+        ET0: NumPy array of hourly reference evapotranspiration in millimeters.
+        theta_fc: NumPy array of volumetric soil moisture at field capacity, one value per plant.
+        theta_wp: NumPy array of volumetric soil moisture at wilting point, one value per plant.
+        kc: NumPy array of crop coefficients, one value per plant.
+        root_depth: NumPy array of root zone depths in metres, one value per plant.
     
     Returns:
-        The Excel-style column letter (e.g., 'A', 'B', ..., 'AA') for the specified column.
+        A tuple of (plants x hours) NumPy arrays (soil moisture, water stress coefficient Ks, actual ET in millimeters), in float64.
+    """
+    n = P_inf.shape[0]
+    m = kc.shape[0]
+    thetas = np.empty((m, n))
+    kss = np.empty((m, n))
+    et_actuals = np.empty((m, n))
+    for p in prange(m):
+        fc = theta_fc[p]
+        wp = theta_wp[p]
+        theta = fc
+        inv_range = 1.0 / (fc - wp)
+        for i in range(n):
+            if theta >= fc:
+                Ks = 1.0
+            elif theta <= wp:
+                Ks = 0.0
+            else:
+                Ks = (theta - wp) * inv_range
+            
+            ET_actual_mm = Ks * kc[p] * ET0[i]
+            theta += (P_inf[i] - ET_actual_mm / 1000) / root_depth[p]
+            theta = wp if theta < wp else (fc if theta > fc else theta)
+            
+            thetas[p, i] = theta
+            kss[p, i] = Ks
+            et_actuals[p, i] = ET_actual_mm
+    return thetas, kss, et_actuals
+
+def _excel_cell(v):
+    """
+    Converts a DataFrame value into what to_excel would write for it.
     
-    Raises:
-        ValueError: If the column name is not found in the DataFrame.
+    Mirrors to_excel's default na_rep='' and inf_rep='inf': NaN becomes a blank cell and infinities are written as text.
+    
+    Args:
+        v: A single value from a DataFrame row.
+    
+    Returns:
+        The value to pass to xlsxwriter.
     """
-    import string
-    if col_name in weather_df.columns:
-        col_num = weather_df.columns.get_loc(col_name) + 1
-        col_letter = ''
-        while col_num > 0:
-            col_num, remainder = divmod(col_num - 1, 26)
-            col_letter = string.ascii_uppercase[remainder] + col_letter
-        return col_letter
-    else:
-        raise ValueError(f"Column {col_name} not found in DataFrame")
+    if not isinstance(v, float) or math.isfinite(v):
+        return v
+    if math.isnan(v):
+        return ''  # xlsxwriter writes an empty string as a blank cell
+    return 'inf' if v > 0 else '-inf'
 
 # Calculate ET0
-weather_df['ET0_mm'] = weather_df.apply(calculate_et0, axis=1)
+weather_df['ET0_mm'] = calculate_et0_vec(weather_df)
 
-# Initialise total ET actual
-total_et_actual = np.zeros(len(weather_df))
 try:
-    writer = ExcelWriter(output_excel, engine='xlsxwriter')
+    writer = ExcelWriter(output_excel, engine='xlsxwriter', engine_kwargs={'options': {'constant_memory': True}})
 except Exception as e:
     print(f"Error creating Excel file: {e}")
     raise
 
-# Simulate each plant
+# Hourly inputs shared by every plant
+P_m = weather_df['Precip_mm'].to_numpy(dtype=np.float64) / 1000  # mm to m
+P_inf = rainfall_infiltration(P_m)
+ET0_arr = weather_df['ET0_mm'].to_numpy(dtype=np.float64)
+
+# Validate plant parameters
 for plant in plants_config:
     plant_type = plant['type']
     area = plant['area_m2']
@@ -133,7 +244,6 @@ for plant in plants_config:
     theta_wp = plant['wilting_point']
     theta_fc = plant['field_capacity']
     
-    # Validate parameters
     if area <= 0:
         raise ValueError(f"Plant area must be positive, got {area} for {plant_type}")
     if root_depth <= 0:
@@ -145,54 +255,41 @@ for plant in plants_config:
         )
     if kc <= 0:
         raise ValueError(f"Crop coefficient must be positive, got {kc} for {plant_type}")
-    
-    # ... rest of simulation logic ...
-    theta = theta_fc
-    thetas, kss, et_actuals, cooling_kWh = [], [], [], []
-    
-    for i, row in weather_df.iterrows():
-        P = row['Precip_mm'] / 1000  # mm to m
-        ET0_mm = row['ET0_mm']
-        
-        if theta >= theta_fc:
-            Ks = 1
-        elif theta <= theta_wp:
-            Ks = 0
-        else:
-            Ks = (theta - theta_wp) / (theta_fc - theta_wp)
-        
-        ET_actual_mm = Ks * kc * ET0_mm
-        # Calculate infiltration with simple rainfall intensity threshold
-        P_infiltration = P
-        if P * 1000 > 20:  # If precipitation > 20mm, assume partial runoff
-            P_infiltration = min(P, 20/1000 + (P - 20/1000) * 0.7)  # 70% of rainfall above 20mm becomes runoff
-            
-        theta += (P_infiltration - ET_actual_mm / 1000) / root_depth
-        theta = min(max(theta, theta_wp), theta_fc)
-        
-        cooling = ET_actual_mm * area * LAMBDA * MJ_TO_KWH / 1000
-        
-        total_et_actual[i] += ET_actual_mm
-        
-        thetas.append(theta)
-        kss.append(Ks)
-        et_actuals.append(ET_actual_mm)
-        cooling_kWh.append(cooling)
-    
-    # Store in DataFrame
-    weather_df[f'SoilTheta_{plant_type}'] = thetas
-    weather_df[f'Ks_{plant_type}'] = kss
-    weather_df[f'ET_actual_{plant_type}'] = et_actuals
-    weather_df[f'Cooling_{plant_type}_kWh'] = cooling_kWh
+
+# Simulate all plants at once
+kc_arr = np.asarray([plant['kc'] for plant in plants_config], dtype=np.float64)
+rd_arr = np.asarray([plant['root_depth_m'] for plant in plants_config], dtype=np.float64)
+twp_arr = np.asarray([plant['wilting_point'] for plant in plants_config], dtype=np.float64)
+tfc_arr = np.asarray([plant['field_capacity'] for plant in plants_config], dtype=np.float64)
+area_arr = np.asarray([plant['area_m2'] for plant in plants_config], dtype=np.float64)
+
+thetas, kss, et_actuals = simulate_soil_moisture(P_inf, ET0_arr, tfc_arr, twp_arr, kc_arr, rd_arr)
+cooling_kWh = et_actuals * area_arr[:, None] * (LAMBDA * MJ_TO_KWH / 1000)
+
+# Store in DataFrame, adding all result columns in one go to avoid fragmenting the frame
+extras = {}
+for p, plant in enumerate(plants_config):
+    plant_type = plant['type']
+    extras[f'SoilTheta_{plant_type}'] = thetas[p]
+    extras[f'Ks_{plant_type}'] = kss[p]
+    extras[f'ET_actual_{plant_type}'] = et_actuals[p]
+    extras[f'Cooling_{plant_type}_kWh'] = cooling_kWh[p]
 
 # Add total ET line
-weather_df['ET_actual_total'] = total_et_actual
+extras['ET_actual_total'] = et_actuals.sum(axis=0)
+weather_df = pd.concat([weather_df, pd.DataFrame(extras, index=weather_df.index)], axis=1)
+col_idx = {c: i for i, c in enumerate(weather_df.columns)}
 
 # Save and chart
 try:
-    weather_df.to_excel(writer, sheet_name='ET Results', index=False)
+    # constant_memory mode flushes each row as it is written, so rows must be written in order
     workbook = writer.book
-    worksheet = writer.sheets['ET Results']
+    worksheet = workbook.add_worksheet('ET Results')
+    # Match to_excel's bold bordered header
+    header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    worksheet.write_row(0, 0, weather_df.columns, header_format)
+    for r, values in enumerate(weather_df.itertuples(index=False), start=1):
+        worksheet.write_row(r, 0, [_excel_cell(v) for v in values])
     chart = workbook.add_chart({'type': 'line'})
 except Exception as e:
     print(f"Error creating Excel worksheet or chart: {e}")
@@ -203,13 +300,13 @@ for plant in plants_config:
     chart.add_series({
         'name': f'ET_actual_{plant_type}',
         'categories': ['ET Results', 1, 0, len(weather_df), 0],
-        'values':     f'=ET Results!${xl_col_letter(f"ET_actual_{plant_type}")}$2:${xl_col_letter(f"ET_actual_{plant_type}")}${len(weather_df)+1}',
+        'values':     ['ET Results', 1, col_idx[f'ET_actual_{plant_type}'], len(weather_df), col_idx[f'ET_actual_{plant_type}']],
     })
 
 chart.add_series({
     'name': 'ET_actual_total',
     'categories': ['ET Results', 1, 0, len(weather_df), 0],
-    'values':     f'=ET Results!${xl_col_letter("ET_actual_total")}$2:${xl_col_letter("ET_actual_total")}${len(weather_df)+1}',
+    'values':     ['ET Results', 1, col_idx['ET_actual_total'], len(weather_df), col_idx['ET_actual_total']],
     'line': {'width': 2.25, 'dash_type': 'solid', 'color': 'black'}
 })
 
@@ -7,9 +7,30 @@ from et_model import (
     saturation_vapour_pressure,
     delta_vapour_pressure,
     calculate_et0,
-    xl_col_letter
+    calculate_et0_vec,
+    rainfall_infiltration,
+    simulate_soil_moisture
 )
 
+def reference_soil_moisture(P_inf, ET0, theta_fc, theta_wp, kc, root_depth):
+    # Plain-Python soil moisture balance for a single plant, for checking simulate_soil_moisture
+    theta = theta_fc
+    thetas, kss, et_actuals = [], [], []
+    for P, ET0_mm in zip(P_inf, ET0):
+        if theta >= theta_fc:
+            Ks = 1
+        elif theta <= theta_wp:
+            Ks = 0
+        else:
+            Ks = (theta - theta_wp) / (theta_fc - theta_wp)
+        ET_actual_mm = Ks * kc * ET0_mm
+        theta += (P - ET_actual_mm / 1000) / root_depth
+        theta = min(max(theta, theta_wp), theta_fc)
+        thetas.append(theta)
+        kss.append(Ks)
+        et_actuals.append(ET_actual_mm)
+    return np.array(thetas), np.array(kss), np.array(et_actuals)
+
 class TestETModelHelpers(unittest.TestCase):
 
     def test_saturation_vapour_pressure(self):
@@ -18,6 +39,32 @@ class TestETModelHelpers(unittest.TestCase):
         expected = 0.6108 * np.exp((17.27 * T) / (T + 237.3))
         self.assertAlmostEqual(saturation_vapour_pressure(T), expected, places=3)
 
+    def test_saturation_vapour_pressure_table_accuracy(self):
+        T = np.linspace(-50, 60, 10001)
+        expected = 0.6108 * np.exp((17.27 * T) / (T + 237.3))
+        rel_error = np.abs(saturation_vapour_pressure(T) - expected) / expected
+        self.assertLess(rel_error.max(), 1e-5)
+
+    def test_saturation_vapour_pressure_clamped_outside_table(self):
+        es_min = 0.6108 * np.exp((17.27 * -50) / (-50 + 237.3))
+        es_max = 0.6108 * np.exp((17.27 * 60) / (60 + 237.3))
+        result = saturation_vapour_pressure(np.array([-80.0, -50.0, 60.0, 75.0]))
+        self.assertAlmostEqual(result[0], es_min, places=10)
+        self.assertAlmostEqual(result[1], es_min, places=10)
+        self.assertAlmostEqual(result[2], es_max, places=10)
+        self.assertAlmostEqual(result[3], es_max, places=10)
+
+    def test_saturation_vapour_pressure_nan(self):
+        result = saturation_vapour_pressure(np.array([np.nan, 20.0]))
+        self.assertTrue(np.isnan(result[0]))
+        self.assertFalse(np.isnan(result[1]))
+
+    def test_saturation_vapour_pressure_float32(self):
+        T = np.array([-10.0, 0.0, 20.0, 35.0], dtype=np.float32)
+        result = saturation_vapour_pressure(T)
+        self.assertEqual(result.dtype, np.float32)
+        np.testing.assert_allclose(result, saturation_vapour_pressure(T.astype(np.float64)), rtol=1e-6)
+
     def test_delta_vapour_pressure(self):
         # At 20°C, delta ≈ 0.1448 kPa/°C
         T = 20
@@ -49,14 +96,70 @@ class TestETModelHelpers(unittest.TestCase):
         self.assertIsInstance(result, float)
         self.assertGreaterEqual(result, 0)
 
-    def test_xl_col_letter(self):
-        # Mock weather_df in the function's scope
-        import et_model
-        et_model.weather_df = pd.DataFrame(columns=["T", "u2", "RH", "GHI", "Precip_mm"])
-        self.assertEqual(xl_col_letter("T"), "A")
-        self.assertEqual(xl_col_letter("GHI"), "D")
-        with self.assertRaises(ValueError):
-            xl_col_letter("NonExistent")
+    def test_calculate_et0_vec_matches_scalar_formula(self):
+        df = pd.DataFrame({
+            "T": [-5.0, 10.0, 25.0, 38.0],
+            "u2": [0.5, 2.0, 2.0, 6.0],
+            "RH": [95, 70, 60, 10],
+            "GHI": [0, 150, 500, 900]
+        })
+        result = calculate_et0_vec(df)
+        self.assertEqual(len(result), len(df))
+        for i, row in df.iterrows():
+            # Original per-row FAO Penman-Monteith expression
+            T, u2, RH, GHI = row["T"], row["u2"], row["RH"], row["GHI"]
+            es = 0.6108 * np.exp((17.27 * T) / (T + 237.3))
+            ea = es * RH / 100
+            delta = 4098 * es / (T + 237.3) ** 2
+            Rn = GHI * 0.8 / 3.6
+            et0 = ((0.408 * delta * Rn) + (0.0665 * (900 / (T + 273)) * u2 * (es - ea))) / (delta + 0.0665 * (1 + 0.34 * u2))
+            self.assertAlmostEqual(result[i], max(et0, 0), places=4)
+
+    def test_rainfall_infiltration(self):
+        P = np.array([0.0, 0.005, 0.02, 0.03, 0.05], dtype=np.float32)
+        result = rainfall_infiltration(P)
+        # Up to 20mm everything infiltrates; above it only 30% of the excess does
+        expected = [0.0, 0.005, 0.02, 0.023, 0.029]
+        for got, exp in zip(result, expected):
+            self.assertAlmostEqual(float(got), exp, places=6)
+        self.assertEqual(result.dtype, np.float32)
+
+    def test_simulate_soil_moisture_matches_reference(self):
+        rng = np.random.default_rng(0)
+        P_mm = np.where(rng.random(200) < 0.1, rng.exponential(10, 200), 0.0)
+        P_inf = rainfall_infiltration(P_mm / 1000)
+        ET0 = rng.uniform(0, 0.8, 200)
+        theta_fc = np.array([0.35, 0.33])
+        theta_wp = np.array([0.13, 0.12])
+        kc = np.array([1.0, 0.95])
+        root_depth = np.array([1.5, 1.2])
+        thetas, kss, et_actuals = simulate_soil_moisture(P_inf, ET0, theta_fc, theta_wp, kc, root_depth)
+        self.assertEqual(thetas.shape, (2, 200))
+        for p in range(2):
+            ref = reference_soil_moisture(P_inf, ET0, theta_fc[p], theta_wp[p], kc[p], root_depth[p])
+            np.testing.assert_allclose(thetas[p], ref[0], rtol=0, atol=1e-12)
+            np.testing.assert_allclose(kss[p], ref[1], rtol=0, atol=1e-12)
+            np.testing.assert_allclose(et_actuals[p], ref[2], rtol=0, atol=1e-12)
+
+    def test_simulate_soil_moisture_bounds(self):
+        theta_fc = np.array([0.35])
+        theta_wp = np.array([0.13])
+        kc = np.array([1.0])
+        root_depth = np.array([0.1])
+        # Evaporation larger than the available water is clamped at the wilting point, after which Ks is 0
+        P_inf = np.zeros(5)
+        ET0 = np.full(5, 50.0)
+        thetas, kss, et_actuals = simulate_soil_moisture(P_inf, ET0, theta_fc, theta_wp, kc, root_depth)
+        self.assertEqual(kss[0, 0], 1.0)  # starts at field capacity
+        self.assertTrue(np.all(thetas == 0.13))
+        self.assertTrue(np.all(kss[0, 1:] == 0.0))
+        self.assertTrue(np.all(et_actuals[0, 1:] == 0.0))
+        # Heavy rain with no evaporation never lifts the soil above field capacity
+        P_inf = np.full(20, 0.05)
+        ET0 = np.zeros(20)
+        thetas, kss, et_actuals = simulate_soil_moisture(P_inf, ET0, theta_fc, theta_wp, kc, root_depth)
+        self.assertTrue(np.all(thetas == 0.35))
+        self.assertTrue(np.all(kss == 1.0))
 
 if __name__ == "__main__":
     unittest.main()